@@ -1,11 +1,17 @@
+import multiprocessing
+import os
+import shutil
+import threading
 import streamlit as st
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-from backend.ingest import extract_text_by_page
+from backend.embeddings import get_model
+from backend.ingest import extract_text_by_page, extract_and_chunk, iter_chunk_dicts, iter_batches
 from backend.chunking import chunk_pages
 from backend.vector_store_faiss import FaissVectorStore
-from backend.rag_service import rag_answer
+from backend.rag_service import rag_answer_stream
 from backend.handbook_service import generate_handbook
 
 # -----------------------------
@@ -43,6 +49,9 @@ PDF_STORAGE_DIR.mkdir(parents=True, exist_ok=True)
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 HANDBOOK_DIR.mkdir(parents=True, exist_ok=True)
 
+# Chunks embedded + inserted per add_chunks call (matches the CPU encode batch)
+INDEX_BATCH_SIZE = 64
+
 # -----------------------------
 # Session state
 # -----------------------------
@@ -55,13 +64,32 @@ if "messages" not in st.session_state:
 if "last_handbook_path" not in st.session_state:
     st.session_state.last_handbook_path = ""
 
+
+@st.cache_data(ttl=60)
+def list_stored_pdfs(dir_str: str) -> list[str]:
+    """Directory listing reused across reruns; cleared after each upload."""
+    return [str(p) for p in sorted(Path(dir_str).glob("*.pdf"))]
+
+
 # Rehydrate PDF list from disk on restart
 if not st.session_state.uploaded_pdf_paths:
-    st.session_state.uploaded_pdf_paths = [str(p) for p in sorted(PDF_STORAGE_DIR.glob("*.pdf"))]
+    st.session_state.uploaded_pdf_paths = list_stored_pdfs(str(PDF_STORAGE_DIR))
 
 # Vector store (local)
 store = FaissVectorStore(store_dir=str(DATA_DIR))
 
+
+@st.cache_resource
+def prefetch_embedding_model():
+    """Load the embedding model in the background, once per process."""
+    loader = threading.Thread(target=get_model, daemon=True)
+    loader.start()
+    return loader
+
+
+# Model loads while the user is still uploading/typing, not on the first click
+prefetch_embedding_model()
+
 # -----------------------------
 # Sidebar: Upload + Index
 # -----------------------------
@@ -78,14 +106,17 @@ with st.sidebar:
         new_count = 0
         for f in uploaded_files:
             save_path = PDF_STORAGE_DIR / f.name
+            # Stream in 1 MB blocks instead of materializing the whole PDF
+            f.seek(0)
             with open(save_path, "wb") as out:
-                out.write(f.getbuffer())
+                shutil.copyfileobj(f, out, length=1024 * 1024)
 
             p = str(save_path)
             if p not in st.session_state.uploaded_pdf_paths:
                 st.session_state.uploaded_pdf_paths.append(p)
                 new_count += 1
 
+        list_stored_pdfs.clear()
         st.success(f"Saved {new_count} new PDF(s).")
 
     st.divider()
@@ -111,19 +142,16 @@ with st.sidebar:
                 if indexed:
                     st.warning("Already indexed in this session. Reset to re-index.")
                 else:
-                    pages = extract_text_by_page(pdf_for_index)
-                    chunks = chunk_pages(pages, source_path=pdf_for_index)
-
-                    chunk_dicts = [{
-                        "text": c.text,
-                        "page": c.page,
-                        "chunk_index": c.chunk_index,
-                        "source_path": c.source_path
-                    } for c in chunks]
+                    # Embed + insert in small batches; only one batch is resident at a time.
+                    # Write the index to disk once per PDF, not once per batch.
+                    n_chunks = 0
+                    for batch in iter_batches(iter_chunk_dicts(pdf_for_index), INDEX_BATCH_SIZE):
+                        store.add_chunks(batch, save=False)
+                        n_chunks += len(batch)
+                    store.save()
 
-                    store.add_chunks(chunk_dicts)
                     st.session_state.indexed_pdf_paths.append(pdf_for_index)
-                    st.success(f"Indexed {len(chunk_dicts)} chunks.")
+                    st.success(f"Indexed {n_chunks} chunks.")
 
         with col_b:
             if st.button("Reset index", use_container_width=True):
@@ -131,6 +159,25 @@ with st.sidebar:
                 st.session_state.indexed_pdf_paths = []
                 st.warning("Index cleared.")
 
+        pending = [p for p in st.session_state.uploaded_pdf_paths
+                   if p not in st.session_state.indexed_pdf_paths]
+        if len(pending) > 1 and st.button("Index all new PDFs", use_container_width=True):
+            # Extract + chunk in parallel processes, then embed/insert once
+            with st.spinner(f"Indexing {len(pending)} PDFs…"):
+                workers = min(len(pending), os.cpu_count() or 1)
+                # Spawn, not fork: this process has live threads (model
+                # prefetch, torch/OMP pools, the server) and forking it can deadlock
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                ) as ex:
+                    results = list(ex.map(extract_and_chunk, pending))
+
+                chunk_dicts = [c for per_pdf in results for c in per_pdf]
+                store.add_chunks(chunk_dicts)
+                st.session_state.indexed_pdf_paths.extend(pending)
+            st.success(f"Indexed {len(chunk_dicts)} chunks from {len(pending)} PDFs.")
+
         st.caption("Tip: Index at least 1 PDF before chatting or generating a handbook.")
     else:
         st.info("Upload PDFs to enable indexing.")
@@ -171,15 +218,16 @@ with tab_chat:
 
         with st.chat_message("assistant"):
             try:
-                answer, retrieved, context_text = rag_answer(
+                tokens, retrieved, context_text = rag_answer_stream(
                     question=user_input,
                     store=store,
                     k=6
                 )
+                # Render tokens as they arrive; returns the full text at the end
+                answer = st.write_stream(tokens)
             except Exception as e:
                 answer, retrieved, context_text = f"Error during RAG: {e}", [], ""
-
-            st.write(answer)
+                st.write(answer)
 
         st.session_state.messages.append({"role": "assistant", "content": answer})
 
@@ -271,7 +319,7 @@ with tab_debug:
         with colB:
             if st.button("Chunk preview"):
                 pages = extract_text_by_page(pdf_for_preview)
-                chunks = chunk_pages(pages, source_path=pdf_for_preview)
+                chunks = list(chunk_pages(pages, source_path=pdf_for_preview))
                 st.write(f"Chunks: {len(chunks)}")
                 for c in chunks[:2]:
                     st.markdown(f"**Page {c.page} | Chunk {c.chunk_index}**")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import List, Dict
+from typing import Dict, Iterator, List, Tuple
 
 
 @dataclass
@@ -35,28 +35,14 @@ def _split_into_paragraphs(text: str) -> List[str]:
     return paragraphs
 
 
-def _approx_token_count(s: str) -> int:
-    """
-    Approximate token count cheaply.
-
-    Why approximation:
-    - True tokenization depends on the model tokenizer.
-    - For chunking, a rough estimate is enough.
-
-    Rule of thumb: ~4 characters per token in English (varies by language).
-    We'll use word count as a stable approximation.
-    """
-    return max(1, len(s.split()))
-
-
 def chunk_pages(
     pages: List[Dict],
     source_path: str,
     max_tokens: int = 800,
     overlap_tokens: int = 120,
-) -> List[Chunk]:
+) -> Iterator[Chunk]:
     """
-    Convert extracted pages into chunks.
+    Convert extracted pages into chunks, yielded lazily.
 
     Inputs:
       pages: [{"page": 1, "text": "..."}, ...]
@@ -68,11 +54,13 @@ def chunk_pages(
     - max_tokens: keeps retrieval precise and avoids huge chunks
     - overlap_tokens: prevents losing context at chunk boundaries
 
-    Returns:
-      List[Chunk]
-    """
-    chunks: List[Chunk] = []
+    Why a generator:
+    - callers can embed/insert in small batches instead of holding every
+      chunk of a large PDF in memory at once
 
+    Yields:
+      Chunk
+    """
     # Validate parameters defensibly
     if overlap_tokens >= max_tokens:
         raise ValueError("overlap_tokens must be smaller than max_tokens")
@@ -88,25 +76,36 @@ def chunk_pages(
 
         paragraphs = _split_into_paragraphs(text)
 
-        # We build chunks by accumulating paragraphs until we hit max_tokens
+        # Split each paragraph once and record its (word_start, word_end) span
+        # in the page-level word list. Word count is our token approximation:
+        # true tokenization depends on the model tokenizer, and for chunking a
+        # rough estimate is enough.
+        words: List[str] = []
+        para_spans: List[Tuple[int, int]] = []
+        for para in paragraphs:
+            word_start = len(words)
+            words.extend(para.split())
+            para_spans.append((word_start, len(words)))
+
+        # We build chunks by accumulating paragraphs until we hit max_tokens.
+        # A chunk always covers a contiguous word range starting at chunk_start,
+        # so token counts are plain index arithmetic.
         current_parts: List[str] = []
-        current_tokens = 0
+        chunk_start = 0
         chunk_index = 0
 
-        for para in paragraphs:
-            para_tokens = _approx_token_count(para)
-
+        for para, (word_start, word_end) in zip(paragraphs, para_spans):
             # If adding this paragraph would exceed max size, we finalize current chunk
-            if current_parts and (current_tokens + para_tokens > max_tokens):
-                chunk_text = "\n\n".join(current_parts).strip()
-
-                chunks.append(
-                    Chunk(
-                        text=chunk_text,
-                        page=page_num,
-                        chunk_index=chunk_index,
-                        source_path=source_path,
-                    )
+            if current_parts and (word_end - chunk_start > max_tokens):
+                # Parts are already stripped paragraphs / whitespace-free overlap
+                # words, so the joined text needs no further strip() pass
+                chunk_text = "\n\n".join(current_parts)
+
+                yield Chunk(
+                    text=chunk_text,
+                    page=page_num,
+                    chunk_index=chunk_index,
+                    source_path=source_path,
                 )
                 chunk_index += 1
 
@@ -115,28 +114,21 @@ def chunk_pages(
                 # This reduces the chance that important context is split across boundary.
                 if overlap_tokens > 0:
                     # Simple overlap strategy: keep last N words of the chunk
-                    words = chunk_text.split()
-                    overlap_words = words[-overlap_tokens:] if len(words) > overlap_tokens else words
-                    current_parts = [" ".join(overlap_words)]
-                    current_tokens = _approx_token_count(current_parts[0])
+                    chunk_start = max(chunk_start, word_start - overlap_tokens)
+                    current_parts = [" ".join(words[chunk_start:word_start])]
                 else:
                     current_parts = []
-                    current_tokens = 0
+                    chunk_start = word_start
 
             # Add paragraph to current chunk buffer
             current_parts.append(para)
-            current_tokens += para_tokens
 
         # Flush any remaining content as final chunk for the page
         if current_parts:
-            chunk_text = "\n\n".join(current_parts).strip()
-            chunks.append(
-                Chunk(
-                    text=chunk_text,
-                    page=page_num,
-                    chunk_index=chunk_index,
-                    source_path=source_path,
-                )
+            chunk_text = "\n\n".join(current_parts)
+            yield Chunk(
+                text=chunk_text,
+                page=page_num,
+                chunk_index=chunk_index,
+                source_path=source_path,
             )
-
-    return chunks
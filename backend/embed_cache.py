@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+# SQLite caps bound parameters per statement; stay well below the limit
+_LOOKUP_BATCH = 500
+
+
+class EmbeddingCache:
+    """
+    Persistent text -> embedding cache backed by a SQLite file.
+
+    Problem solved:
+    - Re-indexing a PDF (e.g. after a reset) re-embeds chunks whose text
+      has not changed. A hit skips the model forward pass entirely.
+
+    Keys are a hash of (model name, text), so swapping the embedding model
+    never serves stale vectors.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # closing() closes the connection; "with conn" only commits/rolls back
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL)"
+            )
+
+    @staticmethod
+    def key(model_name: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        """Return the cached vectors for whichever keys are present."""
+        found: dict[bytes, np.ndarray] = {}
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})", batch
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, keys: list[bytes], vectors: np.ndarray) -> None:
+        """Store float32 vectors under the given keys (overwrites existing)."""
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype="float32").tobytes()) for k, v in zip(keys, vectors)],
+            )
@@ -1,20 +1,183 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 
-_model = None
+from backend.embed_cache import EmbeddingCache
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# int8 dynamically-quantized ONNX export shipped in the model repo
+ONNX_QINT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# Generous upper bound on characters per word-piece token. Text beyond
+# max_seq_length * this is cut before tokenization, since the model would
+# truncate it anyway.
+_MAX_CHARS_PER_TOKEN = 8
+
+_MODEL_LOCK = threading.Lock()
+
+# Query embeddings memoized per (model variant, query), least recently used evicted
+QUERY_CACHE_SIZE = 4096
+_QUERY_CACHE: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+_QUERY_CACHE_LOCK = threading.Lock()
+
+
+def get_model(name: str = MODEL_NAME) -> SentenceTransformer:
+    """
+    Load the embedding model once per process.
+
+    Why cached:
+    - Streamlit reruns the script on every interaction; reloading the
+      weights each time costs seconds of disk I/O.
+
+    Thread-safe: a request arriving while the background prefetch is still
+    loading waits for it instead of loading a second copy.
+    """
+    with _MODEL_LOCK:
+        return _load_model(name)
+
+
+@lru_cache(maxsize=None)
+def _load_model(name: str) -> SentenceTransformer:
+    """
+    Build the SentenceTransformer for this process.
+
+    CPU backend controlled by env variable:
+        EMBED_BACKEND = "torch" | "onnx"
+    "onnx" runs the int8-quantized export on ONNX Runtime (fused kernels,
+    int8 GEMMs) and needs `pip install sentence-transformers[onnx]`.
+    """
+    if torch.cuda.is_available():
+        # fp16 halves memory bandwidth on GPU; outputs are cast back to float32
+        return SentenceTransformer(name, device="cuda").half()
+
+    backend = os.getenv("EMBED_BACKEND", "torch").lower()
+
+    if backend == "onnx":
+        onnx_file = os.getenv("EMBED_ONNX_FILE", ONNX_QINT8_FILE)
+        return SentenceTransformer(
+            name,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": onnx_file},
+        )
+
+    if backend == "torch":
+        return SentenceTransformer(name, device="cpu")
+
+    raise ValueError(f"Unsupported EMBED_BACKEND: {backend}")
+
+
+def _model_id() -> str:
+    """Identify the model variant in use, so cached vectors never mix variants."""
+    backend = os.getenv("EMBED_BACKEND", "torch").lower()
+    if backend == "onnx" and not torch.cuda.is_available():
+        return f"{MODEL_NAME}:{os.getenv('EMBED_ONNX_FILE', ONNX_QINT8_FILE)}"
+    return MODEL_NAME
+
+
+def _encode(texts: list[str], batch_size: int | None) -> np.ndarray:
+    """Run the model over texts in one batched encode call."""
+    model = get_model()
+    if batch_size is None:
+        batch_size = 256 if model.device.type == "cuda" else 64
+
+    # Skip tokenizing text the model would drop (chunks run up to ~800 words)
+    max_chars = model.max_seq_length * _MAX_CHARS_PER_TOKEN
+    texts = [t[:max_chars] for t in texts]
+
+    # encode() already length-sorts texts into batches (minimal padding) and
+    # restores the input order, so callers need not pre-sort
+    vecs = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return vecs.astype("float32", copy=False)
+
+
+def embed_texts(
+    texts: list[str],
+    batch_size: int | None = None,
+    cache: EmbeddingCache | None = None,
+) -> np.ndarray:
+    """
+    Embed texts in one batched encode call.
+
+    With a cache, only texts not seen before are encoded; hits are read
+    back from disk and everything is returned in the original order.
+
+    Returns float32 vectors, L2-normalized (critical for cosine similarity).
+    """
+    if cache is None or not texts:
+        return _encode(texts, batch_size)
+
+    model_id = _model_id()
+    keys = [EmbeddingCache.key(model_id, t) for t in texts]
+    cached = cache.get_many(keys)
+
+    miss_idx = [i for i, k in enumerate(keys) if k not in cached]
+    if miss_idx:
+        new_vecs = _encode([texts[i] for i in miss_idx], batch_size)
+        cache.put_many([keys[i] for i in miss_idx], new_vecs)
+        for i, vec in zip(miss_idx, new_vecs):
+            cached[keys[i]] = vec
+
+    return np.stack([cached[k] for k in keys])
+
+
+def embed_query(text: str) -> np.ndarray:
+    """
+    Embed a single query string, memoized per (model variant, query).
+
+    Returns a (D,) float32 vector. See embed_queries.
+    """
+    return embed_queries([text])[0]
+
+
+def embed_queries(texts: list[str]) -> np.ndarray:
+    """
+    Embed query strings, memoized per (model variant, query).
+
+    Chat turns and multi-query retrieval repeat the same strings often; a hit
+    skips the model forward pass, and all misses are encoded in one batched
+    call. Whitespace is collapsed first (the tokenizer ignores it anyway) so
+    trivially different spellings share an entry. The model variant is part
+    of the key so a model swap never serves stale vectors.
+
+    Returns float32 vectors of shape (Q, D), in input order.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype="float32")
+
+    model_id = _model_id()
+    keys = [(model_id, " ".join(t.split())) for t in texts]
 
-def _get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _model
+    with _QUERY_CACHE_LOCK:
+        found = {}
+        for k in keys:
+            if k in _QUERY_CACHE:
+                _QUERY_CACHE.move_to_end(k)
+                found[k] = _QUERY_CACHE[k]
 
-def embed_texts(texts: list[str]) -> np.ndarray:
-    model = _get_model()
-    vecs = model.encode(texts, convert_to_numpy=True).astype("float32")
+    misses = list(dict.fromkeys(k for k in keys if k not in found))
+    if misses:
+        new_vecs = _encode([k[1] for k in misses], None)
+        with _QUERY_CACHE_LOCK:
+            for k, vec in zip(misses, new_vecs):
+                vec.setflags(write=False)
+                found[k] = _QUERY_CACHE[k] = vec
+                _QUERY_CACHE.move_to_end(k)
+            while len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+                _QUERY_CACHE.popitem(last=False)
 
-    # ✅ L2 normalize (critical for cosine similarity)
-    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
-    norms[norms == 0] = 1.0
-    vecs = vecs / norms
-    return vecs
+    return np.stack([found[k] for k in keys])
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Tuple
 
 from backend.llm_xai import chat_completion
 from backend.rag_prompt import format_retrieved_chunks
 from backend.handbook_prompts import outline_messages, section_messages
 
+# Sections are independent LLM calls (network-bound), so run a few at once
+SECTION_WORKERS = 8
+
+# Numbered heading: "1. Intro", "10. Tools", "2.3 Details", "2.3. Details"
+_TOC_RE = re.compile(r"^\s*\d+\.(?:\d+\.?)*\s*\S")
+
 
 def parse_toc(toc_text: str) -> List[str]:
     """
@@ -16,23 +24,29 @@ def parse_toc(toc_text: str) -> List[str]:
 
     You can refine later, but this gets you working fast.
     """
-    lines = [ln.strip() for ln in toc_text.splitlines() if ln.strip()]
-    section_titles = []
-
-    for ln in lines:
-        # Keep lines that start with "1." "2." etc.
-        if len(ln) >= 2 and ln[0].isdigit() and "." in ln[:4]:
-            section_titles.append(ln)
+    # Keep lines that start with "1." "2." etc. (any number of digits)
+    section_titles = [ln.strip() for ln in toc_text.splitlines() if _TOC_RE.match(ln)]
 
     # Fallback: if parsing fails, treat whole toc as one section
     return section_titles or ["1. Introduction"]
 
 
+def _generate_section(section_title: str, retrieved: List[Dict[str, Any]]) -> str:
+    """Generate one section's text from its retrieved evidence."""
+    evidence = format_retrieved_chunks(retrieved, max_chars_per_chunk=1200)
+
+    # Section goals are simple for MVP (later: derive from outline bullets)
+    section_goals = f"Cover this topic thoroughly: {section_title}"
+
+    return chat_completion(section_messages(section_title, section_goals, evidence))
+
+
 def generate_handbook(topic: str, store, out_dir: str = "storage/handbooks") -> Tuple[str, str]:
     """
     Generate a long handbook by:
     1) generating a TOC/outline
-    2) generating each section with its own retrieval
+    2) retrieving evidence for all sections in one batched search
+    3) generating sections concurrently, each from its own evidence
 
     Returns:
       handbook_text, saved_markdown_path
@@ -47,34 +61,40 @@ def generate_handbook(topic: str, store, out_dir: str = "storage/handbooks") ->
     # -----------------------------
     toc = chat_completion(outline_messages(topic))
 
-    # Save header + TOC early (so you have progress even if it crashes)
-    md_file.write_text(f"# Handbook: {topic}\n\n## Table of Contents\n\n{toc}\n\n", encoding="utf-8")
-
-    # -----------------------------
-    # 2) Parse sections
-    # -----------------------------
-    sections = parse_toc(toc)
-
-    # -----------------------------
-    # 3) Generate sections (loop)
-    # -----------------------------
-    for sec in sections:
-        section_title = sec
-
-        # Retrieve evidence for this section (section-driven retrieval)
-        retrieved = store.search(f"{topic} — {section_title}", k=8)
-        evidence = format_retrieved_chunks(retrieved, max_chars_per_chunk=1200)
-
-        # Section goals are simple for MVP (later: derive from outline bullets)
-        section_goals = f"Cover this topic thoroughly: {section_title}"
-
-        section_text = chat_completion(section_messages(section_title, section_goals, evidence))
-
-        # Append section to markdown
-        with md_file.open("a", encoding="utf-8") as f:
-            f.write(f"\n\n---\n\n## {section_title}\n\n")
-            f.write(section_text)
-            f.write("\n")
-
-    handbook_text = md_file.read_text(encoding="utf-8")
-    return handbook_text, str(md_file)
+    # Keep the text in memory as well, so we never re-read the file at the end
+    header = f"# Handbook: {topic}\n\n## Table of Contents\n\n{toc}\n\n"
+    parts = [header]
+
+    # One handle for the whole run; flush after each write so progress
+    # survives a crash mid-generation
+    with md_file.open("w", encoding="utf-8") as f:
+        # Save header + TOC early (so you have progress even if it crashes)
+        f.write(header)
+        f.flush()
+
+        # -----------------------------
+        # 2) Parse sections
+        # -----------------------------
+        sections = parse_toc(toc)
+
+        # -----------------------------
+        # 3) Retrieve evidence for every section in one batched search
+        # -----------------------------
+        queries = [f"{topic} — {section_title}" for section_title in sections]
+        retrieved_per_section = store.search_many(queries, k=8)
+
+        # -----------------------------
+        # 4) Generate sections concurrently, append to disk in TOC order
+        # -----------------------------
+        with ThreadPoolExecutor(max_workers=SECTION_WORKERS) as ex:
+            section_texts = ex.map(_generate_section, sections, retrieved_per_section)
+
+            # map() yields in submission order, so each section is saved as soon
+            # as it and every section before it are done
+            for section_title, section_text in zip(sections, section_texts):
+                part = f"\n\n---\n\n## {section_title}\n\n{section_text}\n"
+                f.write(part)
+                f.flush()
+                parts.append(part)
+
+    return "".join(parts), str(md_file)
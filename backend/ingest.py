@@ -1,7 +1,48 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-import pdfplumber
+from typing import Iterator
 
-def extract_text_by_page(pdf_path: str) -> list[dict]:
+import fitz  # PyMuPDF
+
+from backend.chunking import chunk_pages
+
+# Starting a spawned worker costs ~0.2 s (fresh interpreter, measured without
+# the fitz import), while PyMuPDF extracts a text page in a few milliseconds.
+# So a worker only pays off with on the order of 100+ pages to extract.
+PAGES_PER_WORKER = 128
+
+
+def _extract_range(pdf_path: str, start: int, end: int) -> list[dict]:
+    """
+    Extract pages [start, end) (0-based) of one PDF.
+
+    Opens its own document: PyMuPDF documents are not fork-safe, so each
+    worker process must open the file itself.
+    """
+    pages = []
+
+    # PyMuPDF's C extractor is several times faster than pdfminer-based
+    # parsers and keeps reading order
+    with fitz.open(pdf_path) as doc:
+        for idx in range(start, end):
+            # Extract text; empty on scanned pages
+            text = doc[idx].get_text("text") or ""
+
+            # Normalize whitespace a bit so chunking doesn't get weird
+            text = text.replace("\r", "\n").strip()
+
+            pages.append({
+                "page": idx + 1,
+                "text": text
+            })
+
+    return pages
+
+
+def extract_text_by_page(pdf_path: str, max_workers: int | None = None) -> list[dict]:
     """
     Extract text from a PDF, page by page.
 
@@ -10,6 +51,9 @@ def extract_text_by_page(pdf_path: str) -> list[dict]:
     - Makes chunking controllable
     - Makes debugging extraction quality easy
 
+    Large PDFs are split into contiguous page ranges extracted in parallel
+    processes. max_workers caps the pool (1 = always in-process).
+
     Returns:
         A list of dicts:
         [
@@ -23,20 +67,50 @@ def extract_text_by_page(pdf_path: str) -> list[dict]:
     if not pdf_file.exists():
         raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
-    pages = []
+    with fitz.open(pdf_file) as doc:
+        page_count = doc.page_count
 
-    # pdfplumber reads layout-aware text from each page
-    with pdfplumber.open(pdf_file) as pdf:
-        for idx, page in enumerate(pdf.pages, start=1):
-            # Extract text; may return None on empty/scanned pages
-            text = page.extract_text() or ""
+    n_workers = min(max_workers or os.cpu_count() or 1, max(1, page_count // PAGES_PER_WORKER))
+    if n_workers == 1:
+        return _extract_range(str(pdf_file), 0, page_count)
 
-            # Normalize whitespace a bit so chunking doesn't get weird
-            text = text.replace("\r", "\n").strip()
+    # Contiguous shards; map() returns them in order, so pages stay ordered.
+    # Spawn, not fork: the caller (Streamlit) has live threads, and forking a
+    # threaded process can deadlock.
+    bounds = [page_count * i // n_workers for i in range(n_workers + 1)]
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as ex:
+        shards = ex.map(_extract_range, [str(pdf_file)] * n_workers, bounds[:-1], bounds[1:])
+        return [page for shard in shards for page in shard]
 
-            pages.append({
-                "page": idx,
-                "text": text
-            })
 
-    return pages
+def iter_chunk_dicts(pdf_path: str, max_workers: int | None = None) -> Iterator[dict]:
+    """
+    Extract + chunk one PDF, yielding chunk dicts ready for store.add_chunks().
+    """
+    pages = extract_text_by_page(pdf_path, max_workers=max_workers)
+
+    for c in chunk_pages(pages, source_path=pdf_path):
+        yield {
+            "text": c.text,
+            "page": c.page,
+            "chunk_index": c.chunk_index,
+            "source_path": c.source_path
+        }
+
+
+def iter_batches(items, batch_size: int) -> Iterator[list]:
+    """Group any iterable into lists of at most batch_size items."""
+    it = iter(items)
+    while batch := list(islice(it, batch_size)):
+        yield batch
+
+
+def extract_and_chunk(pdf_path: str) -> list[dict]:
+    """
+    Extract + chunk one PDF into a list of chunk dicts.
+
+    Lives at module level so it can be pickled into a process pool:
+    PDF parsing is CPU-bound, so several PDFs can be processed in parallel.
+    Pages are extracted in-process here, since the caller already parallelizes.
+    """
+    return list(iter_chunk_dicts(pdf_path, max_workers=1))
@@ -1,11 +1,87 @@
 from __future__ import annotations
 
+import json
 import os
+import random
+import time
+from typing import Iterator
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 XAI_BASE_URL = "https://api.x.ai"
 CHAT_COMPLETIONS_URL = f"{XAI_BASE_URL}/v1/chat/completions"
 
+# (connect, read) timeouts: fail fast on connect, allow long generations
+REQUEST_TIMEOUT = (10, 120)
+
+# Rate limits / transient server errors: attempts per call and the longest
+# single wait between them (seconds)
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def _build_session() -> requests.Session:
+    """
+    One pooled session per process.
+
+    Problem solved:
+    - requests.post() opens a new TCP + TLS connection per call; a session
+      keeps connections alive, so only the first call pays the handshake.
+
+    The adapter only retries failed connects; 429/5xx responses
+    are retried by chat_completion_stream, which honours Retry-After.
+    """
+    session = requests.Session()
+    # Only failures to connect are retried: the request never reached the
+    # server, so re-sending cannot start a second billed completion. Read
+    # errors (e.g. timing out before the first SSE bytes) are raised as-is.
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=0.3,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+    return session
+
+
+_SESSION = _build_session()
+
+_headers_cache: tuple[str, dict] | None = None
+
+
+def _headers(api_key: str) -> dict:
+    """Build request headers once; rebuild only if XAI_API_KEY changes."""
+    global _headers_cache
+    if _headers_cache is None or _headers_cache[0] != api_key:
+        _headers_cache = (api_key, {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+    return _headers_cache[1]
+
+
+def _retry_delay(resp: requests.Response, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a rate-limited / failed request.
+
+    Uses the server's Retry-After (seconds) when given, otherwise exponential
+    backoff with jitter so concurrent callers don't retry in lockstep.
+    """
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(MAX_BACKOFF, max(0.0, float(retry_after)))
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return min(MAX_BACKOFF, 2 ** attempt + random.random())
+
+
 def chat_completion(messages: list[dict], model: str | None = None) -> str:
     """
     Send messages to Grok and return text (LLM client only).
@@ -15,6 +91,17 @@ def chat_completion(messages: list[dict], model: str | None = None) -> str:
     - No refusal logic
     - Just transport
     """
+    return "".join(chat_completion_stream(messages, model=model))
+
+
+def chat_completion_stream(messages: list[dict], model: str | None = None) -> Iterator[str]:
+    """
+    Send messages to Grok and yield the answer text as it is generated.
+
+    Problem solved:
+    - A blocking call shows nothing until the whole answer is done; streaming
+      puts the first tokens on screen after time-to-first-token.
+    """
     api_key = os.getenv("XAI_API_KEY")
     if not api_key:
         raise RuntimeError("Missing XAI_API_KEY env var")
@@ -23,20 +110,44 @@ def chat_completion(messages: list[dict], model: str | None = None) -> str:
     if not model:
         raise RuntimeError("Missing XAI_MODEL env var (set to an allowed Grok model id)")
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-
     payload = {
         "model": model,
         "messages": messages,
         "temperature": 0.2,
+        "stream": True,
     }
 
-    resp = requests.post(CHAT_COMPLETIONS_URL, headers=headers, json=payload, timeout=120)
-    if resp.status_code >= 400:
-        raise RuntimeError(f"{resp.status_code} {resp.text}")
+    # Retry 429/5xx before any text is yielded, so a retried call never
+    # repeats or interleaves output
+    for attempt in range(MAX_ATTEMPTS):
+        resp = _SESSION.post(
+            CHAT_COMPLETIONS_URL,
+            headers=_headers(api_key),
+            json=payload,
+            timeout=REQUEST_TIMEOUT,
+            stream=True,
+        )
+        if resp.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+            break
+        delay = _retry_delay(resp, attempt)
+        resp.close()
+        time.sleep(delay)
+
+    with resp:
+        if resp.status_code >= 400:
+            raise RuntimeError(f"{resp.status_code} {resp.text}")
+
+        # Server-sent events: one "data: {json}" line per delta, then "data: [DONE]".
+        # Decode bytes ourselves; event-stream responses often omit a charset.
+        for line in resp.iter_lines():
+            if not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                break
 
-    data = resp.json()
-    return data["choices"][0]["message"]["content"]
+            chunk = json.loads(data.decode("utf-8"))
+            choices = chunk.get("choices") or []
+            content = choices[0].get("delta", {}).get("content") if choices else None
+            if content:
+                yield content
@@ -1,7 +1,18 @@
 from __future__ import annotations
 
+import os
+from functools import lru_cache
 from typing import List, Dict
-from pathlib import Path
+
+# Flatten line breaks in evidence text in one pass
+_NEWLINES_TO_SPACE = str.maketrans({"\n": " ", "\r": " "})
+
+
+@lru_cache(maxsize=1024)
+def _basename(source_path: str) -> str:
+    """File name for citations; source paths repeat heavily across chunks."""
+    return os.path.basename(source_path)
+
 
 def format_retrieved_chunks(results: List[Dict], max_chars_per_chunk: int = 1500) -> str:
     """
@@ -13,17 +24,12 @@ def format_retrieved_chunks(results: List[Dict], max_chars_per_chunk: int = 1500
     If skipped:
     - You can't enforce citations; model will guess.
     """
-    lines = []
-    for r in results:
-        source = Path(r["source_path"]).name
-        page = r["page"]
-        chunk_index = r["chunk_index"]
-
-        text = (r.get("text") or "").strip().replace("\n", " ")
-        text = text[:max_chars_per_chunk]  # keep context compact
-
-        lines.append(f"[{source} | p.{page} | c{chunk_index}] {text}")
-    return "\n".join(lines)
+    # Truncate before flattening newlines so only the kept text is copied
+    return "\n".join(
+        f"[{_basename(r['source_path'])} | p.{r['page']} | c{r['chunk_index']}] "
+        f"{(r.get('text') or '').strip()[:max_chars_per_chunk].translate(_NEWLINES_TO_SPACE)}"
+        for r in results
+    )
 
 def build_rag_messages(user_question: str, retrieved_context: str) -> list[dict]:
     """
@@ -1,10 +1,22 @@
 from __future__ import annotations
 
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Iterator
 import re
 
 from backend.rag_prompt import format_retrieved_chunks, build_rag_messages
-from backend.llm_xai import chat_completion
+from backend.llm_xai import chat_completion_stream
+from backend.reranker import rerank, reranker_model_name
+
+_AND_RE = re.compile(r"\s+and\s+", re.IGNORECASE)
+_END_PUNCT_RE = re.compile(r"[;?]+")
+_WS_RE = re.compile(r"\s+")
+
+# Standard RRF damping constant: score = sum over subqueries of 1 / (RRF_K + rank)
+RRF_K = 60
+
+# With a reranker, each subquery fetches at least this many candidates so the
+# cross-encoder can promote chunks that vector search ranked below top-k
+RERANK_POOL = 20
 
 
 def _make_subqueries(question: str) -> List[str]:
@@ -17,12 +29,12 @@ def _make_subqueries(question: str) -> List[str]:
 
     # Split on "and" (most common)
     if " and " in q.lower():
-        parts = re.split(r"\s+and\s+", q, flags=re.IGNORECASE)
+        parts = _AND_RE.split(q)
         subs.extend([p.strip(" .,:;") for p in parts if p.strip()])
 
     # Split on multiple question punctuation
     if ";" in q or "?" in q:
-        parts = re.split(r"[;?]+", q)
+        parts = _END_PUNCT_RE.split(q)
         subs.extend([p.strip(" .,:;") for p in parts if p.strip()])
 
     # Optional: long questions with commas
@@ -34,56 +46,68 @@ def _make_subqueries(question: str) -> List[str]:
     seen = set()
     out = []
     for s in subs:
-        s2 = re.sub(r"\s+", " ", s).strip()
-        if s2 and s2.lower() not in seen:
+        s2 = _WS_RE.sub(" ", s).strip()
+        key = s2.lower()
+        if s2 and key not in seen:
             out.append(s2)
-            seen.add(s2.lower())
+            seen.add(key)
 
     return out[:4]  # cap to avoid too many searches
 
 
-def rag_answer(
-    question: str,
-    store,
-    k: int = 6,
-) -> Tuple[str, List[Dict[str, Any]], str]:
+def _retrieve(question: str, store, k: int) -> List[Dict[str, Any]]:
     """
-    RAG orchestrator: retrieve → decide → prompt → LLM.
+    Retrieve top-k evidence chunks for a question.
 
     Upgraded retrieval:
     - For multi-part questions, run multiple searches and merge results.
+    - Optionally rerank the merged pool with a cross-encoder (RERANKER_MODEL).
     """
-    # 1) Retrieve evidence (multi-query)
     subqueries = _make_subqueries(question)
 
-    merged: List[Dict[str, Any]] = []
-    k_per = max(4, k)  # each subquery gets enough candidates
-
-    for sq in subqueries:
-        merged.extend(store.search(sq, k=k_per))
-
-    # Dedupe by stable chunk identity (source/page/chunk)
-    deduped: Dict[tuple, Dict[str, Any]] = {}
-    for r in merged:
-        key = (r.get("source_path"), r.get("page"), r.get("chunk_index"))
-        if key not in deduped:
-            deduped[key] = r
-        else:
-            # keep the higher score version
-            if float(r.get("score", 0.0)) > float(deduped[key].get("score", 0.0)):
-                deduped[key] = r
-
-    # Keep top-k overall
-    retrieved = sorted(
-        deduped.values(),
-        key=lambda x: float(x.get("score", 0.0)),
-        reverse=True
-    )[:k]
+    use_reranker = bool(reranker_model_name())
+    # each subquery gets enough candidates
+    k_per = max(RERANK_POOL, 3 * k) if use_reranker else max(4, k)
+
+    # Merge with Reciprocal Rank Fusion: raw similarity scores from different
+    # subquery embeddings aren't comparable, but per-query ranks are.
+    # Chunks are keyed by stable identity (source/page/chunk).
+    rrf: Dict[tuple, float] = {}
+    items: Dict[tuple, Dict[str, Any]] = {}
+
+    # One batched search: all subqueries are embedded together
+    for sq_results in store.search_many(subqueries, k=k_per):
+        for rank, r in enumerate(sq_results, start=1):
+            key = (r.get("source_path"), r.get("page"), r.get("chunk_index"))
+            rrf[key] = rrf.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            items.setdefault(key, r)
+
+    candidates = [items[key] for key in sorted(items, key=lambda key: -rrf[key])]
+
+    # Keep top-k overall (cross-encoder order when a reranker is configured)
+    if use_reranker:
+        return rerank(question, candidates, k)
+    return candidates[:k]
+
+
+def rag_answer_stream(
+    question: str,
+    store,
+    k: int = 6,
+) -> Tuple[Iterator[str], List[Dict[str, Any]], str]:
+    """
+    RAG orchestrator: retrieve → decide → prompt → LLM (streamed).
+
+    Retrieval happens up front; the returned iterator yields answer text as
+    Grok generates it, so the UI can render before the answer is complete.
+    """
+    # 1) Retrieve evidence (multi-query)
+    retrieved = _retrieve(question, store, k)
 
     # 2) If no evidence, refuse (prevents hallucination)
     if not retrieved:
         return (
-            "I don't have enough information in the uploaded PDFs.",
+            iter(["I don't have enough information in the uploaded PDFs."]),
             [],
             ""
         )
@@ -93,6 +117,18 @@ def rag_answer(
     messages = build_rag_messages(question, context_text)
 
     # 4) Call Grok (LLM transport only)
-    answer = chat_completion(messages=messages)
+    return chat_completion_stream(messages=messages), retrieved, context_text
+
+
+def rag_answer(
+    question: str,
+    store,
+    k: int = 6,
+) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    RAG orchestrator: retrieve → decide → prompt → LLM.
 
-    return answer, retrieved, context_text
+    Same as rag_answer_stream, with the answer collected into one string.
+    """
+    tokens, retrieved, context_text = rag_answer_stream(question, store, k)
+    return "".join(tokens), retrieved, context_text
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from sentence_transformers import CrossEncoder
+
+
+def reranker_model_name() -> str | None:
+    """
+    Cross-encoder used to rerank merged retrieval results.
+
+    Controlled by env variable:
+        RERANKER_MODEL = e.g. "BAAI/bge-reranker-base"
+
+    Default: unset (reranking disabled; the model is ~1 GB)
+    """
+    return os.getenv("RERANKER_MODEL") or None
+
+
+@lru_cache(maxsize=None)
+def get_reranker(name: str) -> CrossEncoder:
+    """Load the cross-encoder once per process."""
+    return CrossEncoder(name, max_length=512)
+
+
+def rerank(question: str, candidates: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """
+    Reorder candidates by cross-encoder relevance to the question; keep top-k.
+
+    Problem solved:
+    - Vector scores from different subqueries are not comparable; scoring
+      each (question, chunk) pair jointly gives one consistent ranking.
+
+    Each returned dict gets a "rerank_score"; the vector "score" is kept.
+    """
+    name = reranker_model_name()
+    if not name or not candidates:
+        return candidates[:k]
+
+    pairs = [(question, c.get("text") or "") for c in candidates]
+    scores = get_reranker(name).predict(pairs, batch_size=32, show_progress_bar=False)
+
+    ranked = sorted(zip(scores, candidates), key=lambda x: -float(x[0]))[:k]
+    return [dict(c, rerank_score=float(s)) for s, c in ranked]
@@ -1,33 +1,82 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 from pathlib import Path
 from typing import Any
 
 import faiss
+import msgpack
 import numpy as np
 
-from backend.embeddings import embed_texts
+from backend.embed_cache import EmbeddingCache
+from backend.embeddings import embed_queries, embed_query, embed_texts
+
+# Let FAISS add/search use every core
+faiss.omp_set_num_threads(max(1, os.cpu_count() or 1))
+
+# HNSW graph parameters: M = neighbours per node, efConstruction = build-time
+# beam width, efSearch = default query-time beam width (higher = better recall).
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Vectors are rounded to this many decimals before hashing for dedupe, so
+# near-identical boilerplate chunks (headers, footers) share one vector.
+DEDUPE_DECIMALS = 4
+
+# Bookkeeping fields stored on each chunk record but not returned by search()
+_INTERNAL_KEYS = ("vector_id", "vector_key")
 
 
 class FaissVectorStore:
     """
     Local vector store backed by:
-    - FAISS index for similarity search
-    - JSON file for chunk metadata/text
+    - FAISS HNSW index for sub-linear similarity search
+    - append-only msgpack log for chunk metadata/text
 
     This is a local stand-in for Supabase pgvector.
+
+    By default vectors are stored as 8-bit scalars inside the HNSW graph
+    (4x smaller than float32, negligible recall loss on normalized vectors);
+    quantized=False keeps full float32. This only affects newly built
+    indexes; an existing index keeps its type.
+
+    Duplicate vectors are stored once: each chunk record carries the FAISS
+    vector_id it maps to, and search expands a hit into every chunk sharing it.
     """
 
-    def __init__(self, store_dir: str = "storage/data"):
+    def __init__(
+        self,
+        store_dir: str = "storage/data",
+        ef_search: int = HNSW_EF_SEARCH,
+        quantized: bool = True,
+    ):
+        self.ef_search = ef_search
+        self.quantized = quantized
         self.store_dir = Path(store_dir)
         self.store_dir.mkdir(parents=True, exist_ok=True)
 
         self.index_path = self.store_dir / "index.faiss"
-        self.meta_path = self.store_dir / "chunks.json"
+        self.meta_path = self.store_dir / "chunks.msgpack"
+        # Older stores kept metadata as JSON Lines, or before that one JSON array
+        self.legacy_jsonl_path = self.store_dir / "chunks.jsonl"
+        self.legacy_json_path = self.store_dir / "chunks.json"
+
+        # Survives reset(): re-indexing unchanged PDFs skips the embedding model
+        self.embed_cache = EmbeddingCache(str(self.store_dir / "embed_cache.sqlite"))
 
         self.index: faiss.Index | None = None
         self.chunks: list[dict[str, Any]] = []
+        # Records in self.chunks[:_saved_count] are already in the metadata log
+        self._saved_count = 0
+        # True while self.index is a read-only memory map of index_path
+        self._index_mmapped = False
+
+        # Dedupe maps: vector hash -> FAISS id, FAISS id -> chunk positions
+        self._vec_key_to_id: dict[bytes, int] = {}
+        self._vid_to_chunks: dict[int, list[int]] = {}
 
         self._load()
 
@@ -37,19 +86,112 @@ class FaissVectorStore:
 
         Problem solved:
         - App restarts should not force re-embedding everything.
+
+        HNSW graphs are read normally. Legacy flat indexes are memory-mapped
+        read-only so the OS pages vectors in lazily instead of copying the
+        whole index onto the heap on every Streamlit rerun. The index type is
+        read from the file header first, so the file is only parsed once.
         """
+        self._index_mmapped = False
+        self._migrate_legacy_meta()
         if self.index_path.exists() and self.meta_path.exists():
-            self.index = faiss.read_index(str(self.index_path))
-            self.chunks = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            if self._index_file_is_hnsw():
+                self.index = faiss.read_index(str(self.index_path))
+            else:
+                # MMAP_IFC maps the flat codes themselves; plain IO_FLAG_MMAP
+                # only affects IVF lists and would still read into the heap
+                self.index = faiss.read_index(str(self.index_path), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+                self._index_mmapped = True
+            # Records are concatenated msgpack maps; stream-decode them all
+            with self.meta_path.open("rb") as f:
+                self.chunks = list(msgpack.Unpacker(f, raw=False))
         else:
             self.index = None
             self.chunks = []
 
-    def _save(self) -> None:
-        """Persist index + metadata to disk."""
-        if self.index is not None:
-            faiss.write_index(self.index, str(self.index_path))
-        self.meta_path.write_text(json.dumps(self.chunks, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._saved_count = len(self.chunks)
+        self._rebuild_vector_maps()
+
+    def _index_file_is_hnsw(self) -> bool:
+        """Check the index file's fourcc header ("IHN?" for every HNSW variant)."""
+        with self.index_path.open("rb") as f:
+            return f.read(3) == b"IHN"
+
+    def _rebuild_vector_maps(self) -> None:
+        """
+        Rebuild the dedupe maps from chunk records.
+
+        Records written before dedupe have no vector_id; for those the FAISS
+        id is simply the list position (the old 1:1 layout).
+        """
+        self._vec_key_to_id = {}
+        self._vid_to_chunks = {}
+        for pos, c in enumerate(self.chunks):
+            vid = c.get("vector_id", pos)
+            self._vid_to_chunks.setdefault(vid, []).append(pos)
+            if "vector_key" in c:
+                self._vec_key_to_id[bytes.fromhex(c["vector_key"])] = vid
+
+    def _migrate_legacy_meta(self) -> None:
+        """
+        One-time rewrite of legacy JSON / JSONL metadata into chunks.msgpack.
+
+        The log is written aside and renamed into place, and only then are the
+        legacy files deleted: a crash mid-migration leaves the legacy file
+        intact and no chunks.msgpack, so the next start simply migrates again.
+        """
+        if self.meta_path.exists():
+            return
+
+        if self.legacy_jsonl_path.exists():
+            with self.legacy_jsonl_path.open(encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f if line.strip()]
+        elif self.legacy_json_path.exists():
+            chunks = json.loads(self.legacy_json_path.read_text(encoding="utf-8"))
+        else:
+            return
+
+        tmp_path = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        packer = msgpack.Packer(use_bin_type=True)
+        with tmp_path.open("wb") as f:
+            f.write(b"".join(packer.pack(c) for c in chunks))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+        for legacy in (self.legacy_jsonl_path, self.legacy_json_path):
+            if legacy.exists():
+                legacy.unlink()
+
+    def _append_meta(self, chunks: list[dict[str, Any]]) -> None:
+        """Append chunk records to the binary metadata log."""
+        packer = msgpack.Packer(use_bin_type=True)
+        with self.meta_path.open("ab") as f:
+            f.write(b"".join(packer.pack(c) for c in chunks))
+
+    def save(self) -> None:
+        """
+        Persist index + metadata to disk.
+
+        Metadata is an append-only msgpack log: only records added since the
+        last save are written (ingest stays O(N) overall), and loading on
+        every Streamlit rerun decodes binary instead of parsing JSON text.
+        The index itself is rewritten whole, so batch callers should call
+        add_chunks(..., save=False) and save once at the end.
+        Nothing is written when no chunks were added since the last save.
+        """
+        if self._saved_count == len(self.chunks):
+            return
+
+        if self.index is not None and not self._index_mmapped:
+            # (A mapped index is unchanged since load: add_chunks migrates it first.)
+            # Write aside and swap in: truncating index_path in place would
+            # pull the pages out from under any index still mapped from it
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            faiss.write_index(self.index, str(tmp_path))
+            os.replace(tmp_path, self.index_path)
+        self._append_meta(self.chunks[self._saved_count:])
+        self._saved_count = len(self.chunks)
 
     def reset(self) -> None:
         """
@@ -59,12 +201,38 @@ class FaissVectorStore:
         """
         self.index = None
         self.chunks = []
+        self._saved_count = 0
+        self._index_mmapped = False
+        self._vec_key_to_id = {}
+        self._vid_to_chunks = {}
         if self.index_path.exists():
             self.index_path.unlink()
-        if self.meta_path.exists():
-            self.meta_path.unlink()
+        for path in (self.meta_path, self.legacy_jsonl_path, self.legacy_json_path):
+            if path.exists():
+                path.unlink()
+
+    def _new_index(self, dim: int) -> faiss.Index:
+        """
+        Build an empty HNSW index (8-bit scalar-quantized if configured).
+
+        The quantizer is trained on the fixed range [-1, 1], which bounds every
+        component of a unit vector. Learning the range from data would tie it
+        to the first batch indexed: a batch of one chunk gives a zero-width
+        range and every later vector would be encoded as garbage.
+        """
+        # Inner product HNSW; with normalized vectors this behaves like cosine similarity.
+        if self.quantized:
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            sq = faiss.downcast_index(index.storage).sq
+            sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+            sq.rangestat_arg = 0.0
+            index.train(np.stack([-np.ones(dim), np.ones(dim)]).astype("float32"))
+        else:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
 
-    def add_chunks(self, chunk_dicts: list[dict[str, Any]]) -> None:
+    def add_chunks(self, chunk_dicts: list[dict[str, Any]], save: bool = True) -> None:
         """
         Add chunks to the index.
 
@@ -75,29 +243,56 @@ class FaissVectorStore:
         - source_path
 
         We embed the chunk text and insert vectors into FAISS.
+        save=False keeps the new chunks in memory until the next save().
         """
         if not chunk_dicts:
             return
 
         texts = [c["text"] for c in chunk_dicts]
-        vectors = embed_texts(texts)  # shape (N, D), float32, normalized
+        vectors = embed_texts(texts, cache=self.embed_cache)  # shape (N, D), float32
+
+        # Inner product only equals cosine on unit vectors; enforce it here
+        # (SIMD, in place) rather than trusting the embedder
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        faiss.normalize_L2(vectors)
 
         # Build index on first insert
         if self.index is None:
-            dim = vectors.shape[1]
-            # Inner product index; with normalized vectors this behaves like cosine similarity.
-            self.index = faiss.IndexFlatIP(dim)
+            self.index = self._new_index(vectors.shape[1])
 
-        # Add vectors
-        self.index.add(vectors)
+        # A memory-mapped index is a legacy flat index. Load it into memory and
+        # migrate its vectors into HNSW so every later search is sub-linear.
+        if self._index_mmapped:
+            flat = faiss.read_index(str(self.index_path))
+            self._index_mmapped = False
+
+            self.index = self._new_index(flat.d)
+            if flat.ntotal:
+                self.index.add(flat.reconstruct_n(0, flat.ntotal))
+
+        # Only insert vectors not already in the index; duplicates point at
+        # the existing FAISS id instead
+        new_vectors = []
+        for c, vec in zip(chunk_dicts, vectors):
+            key = hashlib.blake2b(np.round(vec, DEDUPE_DECIMALS).tobytes(), digest_size=16).digest()
+            vid = self._vec_key_to_id.get(key)
+            if vid is None:
+                vid = self.index.ntotal + len(new_vectors)
+                self._vec_key_to_id[key] = vid
+                new_vectors.append(vec)
 
-        # Append metadata in same order; FAISS ids correspond to list positions
-        self.chunks.extend(chunk_dicts)
+            self._vid_to_chunks.setdefault(vid, []).append(len(self.chunks))
+            self.chunks.append(dict(c, vector_id=vid, vector_key=key.hex()))
+
+        # Add vectors
+        if new_vectors:
+            self.index.add(np.stack(new_vectors))
 
         # Persist so we can reuse after restart
-        self._save()
+        if save:
+            self.save()
 
-    def search(self, query: str, k: int = 5) -> list[dict[str, Any]]:
+    def search(self, query: str, k: int = 5, ef_search: int | None = None) -> list[dict[str, Any]]:
         """
         Search for top-k chunks matching the query.
 
@@ -106,15 +301,75 @@ class FaissVectorStore:
         if self.index is None or not self.chunks:
             return []
 
-        q_vec = embed_texts([query])  # shape (1, D)
-        scores, idxs = self.index.search(q_vec, k)
+        return self.search_by_vector(embed_query(query), k=k, ef_search=ef_search)
+
+    def search_by_vector(
+        self,
+        q_vec: np.ndarray,
+        k: int = 5,
+        ef_search: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Search with a precomputed query embedding (skips re-embedding).
+        """
+        q_vecs = np.array(q_vec, dtype="float32").reshape(1, -1)
+        return self._search_vectors(q_vecs, k, ef_search)[0]
+
+    def search_many(
+        self,
+        queries: list[str],
+        k: int = 5,
+        ef_search: int | None = None,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        Search several queries at once.
+
+        Repeated queries come from the query-embedding cache; the rest are
+        embedded in one call, and FAISS scores them all in a single batched
+        search. Returns one result list per query, in query order.
+        """
+        if self.index is None or not self.chunks or not queries:
+            return [[] for _ in queries]
+
+        q_vecs = embed_queries(queries)  # shape (Q, D)
+        return self._search_vectors(q_vecs, k, ef_search)
+
+    def _search_vectors(
+        self,
+        q_vecs: np.ndarray,
+        k: int,
+        ef_search: int | None,
+    ) -> list[list[dict[str, Any]]]:
+        """
+        Run one batched FAISS search for a (Q, D) matrix of query vectors.
+
+        ef_search overrides the HNSW beam width for this call. By default it
+        grows with k, so larger retrievals (e.g. handbook sections) search wider.
+        """
+        if self.index is None or not self.chunks:
+            return [[] for _ in range(len(q_vecs))]
+
+        q_vecs = np.ascontiguousarray(q_vecs, dtype="float32")
+        faiss.normalize_L2(q_vecs)
+
+        if isinstance(self.index, faiss.IndexHNSW):
+            ef = ef_search or max(self.ef_search, 16 * k)
+            params = faiss.SearchParametersHNSW(efSearch=ef)
+            scores, idxs = self.index.search(q_vecs, k, params=params)
+        else:
+            scores, idxs = self.index.search(q_vecs, k)
 
-        results: list[dict[str, Any]] = []
-        for score, idx in zip(scores[0], idxs[0]):
-            if idx < 0:
-                continue
-            item = dict(self.chunks[idx])
-            item["score"] = float(score)
-            results.append(item)
+        all_results: list[list[dict[str, Any]]] = []
+        for score_row, idx_row in zip(scores, idxs):
+            results: list[dict[str, Any]] = []
+            for score, idx in zip(score_row, idx_row):
+                if idx < 0:
+                    continue
+                # Expand a shared vector into every chunk that maps to it
+                for pos in self._vid_to_chunks.get(int(idx), ()):
+                    item = {key: v for key, v in self.chunks[pos].items() if key not in _INTERNAL_KEYS}
+                    item["score"] = float(score)
+                    results.append(item)
+            all_results.append(results[:k])
 
-        return results
+        return all_results
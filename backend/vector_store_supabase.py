@@ -1,12 +1,23 @@
 from __future__ import annotations
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List
 
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
 from supabase import create_client, Client
 
-from backend.embeddings import embed_texts
+from backend.embeddings import embed_queries, embed_query, embed_texts
+
+
+# Rows per chunks insert (payload limit) and how many inserts run at once
+INSERT_BATCH = 200
+INSERT_WORKERS = 4
+
+# PostgREST error code for "function not found in the schema cache"
+PGRST_FUNCTION_NOT_FOUND = "PGRST202"
 
 
 class SupabaseVectorStore:
@@ -16,6 +27,7 @@ class SupabaseVectorStore:
     Contract matches FaissVectorStore:
       - add_chunks(list[dict]) -> None
       - search(query: str, k: int) -> list[dict]  (with score)
+      - search_many(queries: list[str], k: int) -> list[list[dict]]
 
     Requires env vars:
       SUPABASE_URL
@@ -31,26 +43,28 @@ class SupabaseVectorStore:
 
         self.client: Client = create_client(url, key)
 
-    def _get_or_create_document(self, source_path: str) -> str:
+    def _get_or_create_documents(self, names: List[str]) -> Dict[str, str]:
         """
-        Ensure there's a row in documents for a given PDF.
-        Returns document_id (uuid as string).
+        Ensure there's a row in documents for each PDF, in two round-trips.
+
+        names are normalized source paths (filenames only, to avoid local
+        absolute paths in DB). Returns {name: document_id (uuid as string)}.
         """
-        # Normalize: store only filename to avoid local absolute paths in DB
-        normalized = Path(source_path).name
-
-        # Try fetch
-        res = self.client.table("documents").select("id").eq("source_path", normalized).execute()
-        if res.data:
-            return res.data[0]["id"]
-
-        # Insert
-        ins = self.client.table("documents").insert({
-            "source_path": normalized,
-            "title": normalized
-        }).execute()
+        names = sorted(set(names))
+
+        # Fetch all existing documents at once
+        res = self.client.table("documents").select("id, source_path").in_("source_path", names).execute()
+        name_to_id = {row["source_path"]: row["id"] for row in (res.data or [])}
 
-        return ins.data[0]["id"]
+        # Insert whatever is missing in one batch
+        missing = [n for n in names if n not in name_to_id]
+        if missing:
+            ins = self.client.table("documents").insert([
+                {"source_path": n, "title": n} for n in missing
+            ]).execute()
+            name_to_id.update({row["source_path"]: row["id"] for row in ins.data})
+
+        return name_to_id
 
     def add_chunks(self, chunk_dicts: List[Dict[str, Any]]) -> None:
         """
@@ -69,54 +83,105 @@ class SupabaseVectorStore:
         texts = [c["text"] for c in chunk_dicts]
         vectors = embed_texts(texts)  # numpy float32, shape (N, D)
 
-        # 2) Batch insert chunks. Group by document for cleaner metadata.
+        # 2) Resolve every document once (not once per chunk). A batch holds
+        # few distinct PDFs, so normalize each path once, not per chunk.
+        path_to_name = {p: Path(p).name for p in {c["source_path"] for c in chunk_dicts}}
+        name_to_id = self._get_or_create_documents(list(path_to_name.values()))
+
+        # 3) Batch insert chunks. Group by document for cleaner metadata.
         rows = []
         for i, c in enumerate(chunk_dicts):
-            doc_id = self._get_or_create_document(c["source_path"])
+            name = path_to_name[c["source_path"]]
 
             rows.append({
-                "document_id": doc_id,
+                "document_id": name_to_id[name],
                 "content": c["text"],
                 "metadata": {
                     "page": int(c["page"]),
                     "chunk_index": int(c["chunk_index"]),
-                    "source_path": Path(c["source_path"]).name
+                    "source_path": name
                 },
                 # supabase client will serialize list fine
                 "embedding": vectors[i].tolist()
             })
 
-        # Insert in chunks to avoid payload limits
-        BATCH = 200
-        for start in range(0, len(rows), BATCH):
-            batch = rows[start:start + BATCH]
-            self.client.table("chunks").insert(batch).execute()
+        # Insert in chunks to avoid payload limits. Batches are independent, so
+        # send them concurrently; return=minimal skips echoing the rows back.
+        batches = [rows[start:start + INSERT_BATCH] for start in range(0, len(rows), INSERT_BATCH)]
+        with ThreadPoolExecutor(max_workers=min(INSERT_WORKERS, len(batches))) as ex:
+            list(ex.map(self._insert_chunks, batches))
+
+    def _insert_chunks(self, batch: List[Dict[str, Any]]) -> None:
+        """Insert one batch of chunk rows without returning them."""
+        self.client.table("chunks").insert(batch, returning=ReturnMethod.minimal).execute()
 
     def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
         """
         Similarity search via RPC match_chunks.
         Returns list in the same shape as FAISS store.search() results.
         """
-        q_vec = embed_texts([query])[0].tolist()
+        q_vec = embed_query(query).tolist()
+        return self._match_chunks(q_vec, k)
+
+    def search_many(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Search several queries in one round-trip.
 
+        Embeds the queries not already in the query-embedding cache in one
+        batched call, then scores them all together via
+        RPC match_chunks_batch (falls back to concurrent match_chunks calls if
+        that function is missing). Returns one result list per query, in query order.
+        """
+        if not queries:
+            return []
+
+        q_vecs = [v.tolist() for v in embed_queries(queries)]
+
+        try:
+            rpc = self.client.rpc("match_chunks_batch", {
+                "query_embeddings": q_vecs,
+                "match_count": int(k)
+            }).execute()
+        except APIError as e:
+            # Any other error (permissions, dimension mismatch, timeout) is real
+            if e.code != PGRST_FUNCTION_NOT_FOUND:
+                raise
+            # Batched RPC not deployed: run the per-query RPCs concurrently so
+            # total latency is that of the slowest one, not their sum
+            with ThreadPoolExecutor(max_workers=len(q_vecs)) as ex:
+                return list(ex.map(lambda v: self._match_chunks(v, k), q_vecs))
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for row in (rpc.data or []):
+            results[int(row["query_index"])].append(self._to_result(row))
+
+        return results
+
+    def _match_chunks(self, q_vec: List[float], k: int) -> List[Dict[str, Any]]:
+        """Run the match_chunks RPC for one query embedding."""
         rpc = self.client.rpc("match_chunks", {
             "query_embedding": q_vec,
             "match_count": int(k),
             "filter": {}
         }).execute()
 
-        results = []
-        for row in (rpc.data or []):
-            md = row.get("metadata") or {}
-            results.append({
-                "text": row.get("content", ""),
-                "page": md.get("page", None),
-                "chunk_index": md.get("chunk_index", None),
-                "source_path": md.get("source_path", "unknown"),
-                "score": float(row.get("score", 0.0))
-            })
+        return [self._to_result(row) for row in (rpc.data or [])]
 
-        return results
+    @staticmethod
+    def _to_result(row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Map an RPC row to the FAISS store.search() result shape.
+
+        The RPCs already trim content to 1,500 chars (see README schema).
+        """
+        md = row.get("metadata") or {}
+        return {
+            "text": row["content"],
+            "page": md.get("page", None),
+            "chunk_index": md.get("chunk_index", None),
+            "source_path": md.get("source_path", "unknown"),
+            "score": float(row.get("score", 0.0))
+        }
 
     def reset(self) -> None:
         """
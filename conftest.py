@@ -0,0 +1,2 @@
+# Root conftest: makes pytest put the repo root on sys.path (rootdir-relative
+# imports such as `from backend import ...` work under plain `pytest` too).
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+msgpack = pytest.importorskip("msgpack")
+pytest.importorskip("sentence_transformers")
+
+from backend import vector_store_faiss
+from backend.vector_store_faiss import FaissVectorStore
+
+DIM = 384
+
+
+def _fake_embed(texts, batch_size=None, cache=None):
+    """Deterministic unit vectors per text, standing in for the model."""
+    vecs = []
+    for t in texts:
+        seed = int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "little")
+        vecs.append(np.random.default_rng(seed).standard_normal(DIM))
+    vecs = np.array(vecs, dtype="float32")
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def _chunks(start: int, n: int) -> list[dict]:
+    return [
+        {"text": f"chunk {i}", "page": 1, "chunk_index": i, "source_path": "doc.pdf"}
+        for i in range(start, start + n)
+    ]
+
+
+@pytest.mark.parametrize("first_batch", [1, 2])
+def test_tiny_first_batch_keeps_later_chunks_searchable(tmp_path, monkeypatch, first_batch):
+    # Regression: the 8-bit quantizer used to learn its range from the first
+    # batch, so a one-chunk first PDF broke every vector added afterwards.
+    monkeypatch.setattr(vector_store_faiss, "embed_texts", _fake_embed)
+    store = FaissVectorStore(store_dir=str(tmp_path), quantized=True)
+
+    store.add_chunks(_chunks(0, first_batch))
+    later = _chunks(first_batch, 300)
+    store.add_chunks(later)
+
+    hits = 0
+    for c in later[:100]:
+        top = store.search_by_vector(_fake_embed([c["text"]])[0], k=1)
+        hits += bool(top) and top[0]["chunk_index"] == c["chunk_index"]
+    assert hits >= 95
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+def test_legacy_flat_index_is_memory_mapped(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_faiss, "embed_texts", _fake_embed)
+    chunks = _chunks(0, 10)
+    flat = faiss.IndexFlatIP(DIM)
+    flat.add(_fake_embed([c["text"] for c in chunks]))
+    faiss.write_index(flat, str(tmp_path / "index.faiss"))
+    (tmp_path / "chunks.msgpack").write_bytes(b"".join(msgpack.packb(c) for c in chunks))
+
+    store = FaissVectorStore(store_dir=str(tmp_path))
+
+    assert store._index_mmapped
+    with open("/proc/self/maps") as f:
+        assert str(tmp_path / "index.faiss") in f.read()
+    top = store.search_by_vector(_fake_embed(["chunk 3"])[0], k=1)
+    assert top[0]["chunk_index"] == 3
+
+    # The first write migrates to HNSW and replaces the file, not truncates it
+    store.add_chunks(_chunks(10, 5))
+    assert not store._index_mmapped
+    assert FaissVectorStore(store_dir=str(tmp_path)).index.ntotal == 15
+
+
+def test_save_without_new_chunks_leaves_files_untouched(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store_faiss, "embed_texts", _fake_embed)
+    store = FaissVectorStore(store_dir=str(tmp_path))
+    store.add_chunks(_chunks(0, 5))
+    before = [os.stat(p).st_mtime_ns for p in (store.index_path, store.meta_path)]
+
+    store.add_chunks([], save=False)
+    store.save()
+
+    assert [os.stat(p).st_mtime_ns for p in (store.index_path, store.meta_path)] == before
+
+
+@pytest.mark.parametrize("legacy_name", ["chunks.json", "chunks.jsonl"])
+def test_legacy_metadata_migrates_to_msgpack(tmp_path, legacy_name):
+    chunks = _chunks(0, 5)
+    legacy = tmp_path / legacy_name
+    if legacy_name.endswith(".jsonl"):
+        legacy.write_text("".join(json.dumps(c) + "\n" for c in chunks), encoding="utf-8")
+    else:
+        legacy.write_text(json.dumps(chunks), encoding="utf-8")
+    # Leftover from a migration that died mid-write: must not be trusted
+    (tmp_path / "chunks.msgpack.tmp").write_bytes(b"\x85\xa4te")
+
+    store = FaissVectorStore(store_dir=str(tmp_path))
+
+    assert not legacy.exists()
+    assert not (tmp_path / "chunks.msgpack.tmp").exists()
+    with store.meta_path.open("rb") as f:
+        assert list(msgpack.Unpacker(f, raw=False)) == chunks